@@ -4,23 +4,26 @@ import click as ck
 import numpy as np
 import pandas as pd
 import tensorflow as tf
-from tensorflow.python.framework import function
+import os
 import re
+import tempfile
+import zipfile
 import math
-import matplotlib.pyplot as plt
+from array import array
 import logging
 from tensorflow.keras.layers import (
     Input,
 )
 from tensorflow.keras import optimizers
-from tensorflow.keras import constraints
-from tensorflow.keras.callbacks import ModelCheckpoint, EarlyStopping, CSVLogger
+from tensorflow.keras.callbacks import ModelCheckpoint, CSVLogger
 from tensorflow.keras import backend as K
 from scipy.stats import rankdata
 
 
 config = tf.ConfigProto(allow_soft_placement=True)
 config.gpu_options.allow_growth = True
+# Let XLA fuse the element-wise chains of the losses
+config.graph_options.optimizer_options.global_jit_level = tf.OptimizerOptions.ON_1
 session = tf.Session(config=config)
 K.set_session(session)
 
@@ -104,31 +107,23 @@ def main(data_file, valid_data_file, out_classes_file, out_relations_file,
     for key, val in train_data.items():
         nb_train_data = max(len(val), nb_train_data)
     train_steps = int(math.ceil(nb_train_data / (1.0 * batch_size)))
-    train_generator = Generator(train_data, batch_size, steps=train_steps)
+    train_dataset = make_dataset(train_data, batch_size)
+    train_batch, train_labels = train_dataset.make_one_shot_iterator().get_next()
 
-    cls_dict = {v: k for k, v in classes.items()}
-    rel_dict = {v: k for k, v in relations.items()}
-
-    cls_list = []
-    rel_list = []
-    for i in range(nb_classes):
-        cls_list.append(cls_dict[i])
-    for i in range(nb_relations):
-        rel_list.append(rel_dict[i])
+    cls_list = sorted(classes, key=classes.get)
+    rel_list = sorted(relations, key=relations.get)
 
     with tf.device('/' + device):
-        nf1 = Input(shape=(2,), dtype=np.int32)
-        nf2 = Input(shape=(3,), dtype=np.int32)
-        nf3 = Input(shape=(3,), dtype=np.int32)
-        nf4 = Input(shape=(3,), dtype=np.int32)
-        dis = Input(shape=(3,), dtype=np.int32)
-        top = Input(shape=(1,), dtype=np.int32)
-        nf3_neg = Input(shape=(3,), dtype=np.int32)
+        # Inputs read straight from the prefetched dataset iterator. Its
+        # batches always have batch_size rows, so the graph is fully static.
+        nf1, nf2, nf3, nf4, dis, top, nf3_neg = [
+            Input(tensor=x) for x in train_batch]
         el_model = ELModel(nb_classes, nb_relations, embedding_size, batch_size, margin, reg_norm)
         out = el_model([nf1, nf2, nf3, nf4, dis, top, nf3_neg])
         model = tf.keras.Model(inputs=[nf1, nf2, nf3, nf4, dis, top, nf3_neg], outputs=out)
         optimizer = optimizers.Adam(lr=learning_rate)
-        model.compile(optimizer=optimizer, loss='mse')
+        model.compile(
+            optimizer=optimizer, loss=zero_mse, target_tensors=[train_labels])
 
         # TOP Embedding
         top = classes.get('owl:Thing', None)
@@ -144,37 +139,38 @@ def main(data_file, valid_data_file, out_classes_file, out_relations_file,
         logger = CSVLogger(loss_history_file)
 
         # Save initial embeddings
-        cls_embeddings = el_model.cls_embeddings.get_weights()[0]
-        rel_embeddings = el_model.rel_embeddings.get_weights()[0]
+        cls_embeddings, rel_embeddings = K.batch_get_value(
+            [el_model.cls_embeddings.embeddings,
+             el_model.rel_embeddings.embeddings])
 
         # Save embeddings of every thousand epochs
         # if (epoch + 1) % 1000 == 0:
-        cls_file = f'{out_classes_file}_0.pkl'
-        rel_file = f'{out_relations_file}_0.pkl'
-
-        df = pd.DataFrame(
-            {'classes': cls_list, 'embeddings': list(cls_embeddings)})
-        df.to_pickle(cls_file)
+        cls_file = f'{out_classes_file}_0.npz'
+        rel_file = f'{out_relations_file}_0.npz'
 
-        df = pd.DataFrame(
-            {'relations': rel_list, 'embeddings': list(rel_embeddings)})
-        df.to_pickle(rel_file)
+        np.savez(cls_file, classes=cls_list, embeddings=cls_embeddings)
+        np.savez(rel_file, relations=rel_list, embeddings=rel_embeddings)
 
         
-        model.fit_generator(
-            train_generator,
+        model.fit(
             steps_per_epoch=train_steps,
             epochs=epochs,
-            workers=12,
+            verbose=2,
             callbacks=[logger, checkpointer])
 
 
+def zero_mse(y_true, y_pred):
+    """Mean squared error against the all-zero targets."""
+    return K.mean(K.square(y_pred), axis=-1)
+
+
 class ELModel(tf.keras.Model):
 
     def __init__(self, nb_classes, nb_relations, embedding_size, batch_size, margin=0.01, reg_norm=1):
         super(ELModel, self).__init__()
         self.nb_classes = nb_classes
         self.nb_relations = nb_relations
+        self.embedding_size = embedding_size
         self.margin = margin
         self.reg_norm = reg_norm
         self.batch_size = batch_size
@@ -200,156 +196,132 @@ class ELModel(tf.keras.Model):
     def call(self, input):
         """Run the model."""
         nf1, nf2, nf3, nf4, dis, top, nf3_neg = input
-        loss1 = self.nf1_loss(nf1)
-        loss2 = self.nf2_loss(nf2)
-        loss3 = self.nf3_loss(nf3)
-        loss4 = self.nf4_loss(nf4)
-        loss_dis = self.dis_loss(dis)
+        # Embed all classes and relations of the batch with one gather each
+        cls_ids = [nf1[:, 0], nf1[:, 1], nf2[:, 0], nf2[:, 1], nf2[:, 2],
+                   nf3[:, 0], nf3[:, 2], nf4[:, 1], nf4[:, 2],
+                   dis[:, 0], dis[:, 1], nf3_neg[:, 0], nf3_neg[:, 2]]
+        rel_ids = [nf3[:, 1], nf4[:, 0], nf3_neg[:, 1]]
+        (nf1_c, nf1_d, nf2_c, nf2_d, nf2_e, nf3_c, nf3_d, nf4_c, nf4_d,
+         dis_c, dis_d, neg_c, neg_d) = self.lookup(self.cls_embeddings, cls_ids)
+        nf3_r, nf4_r, neg_r = self.lookup(self.rel_embeddings, rel_ids)
+
+        loss1 = self.nf1_loss(nf1_c, nf1_d)
+        loss2 = self.nf2_loss(nf2_c, nf2_d, nf2_e)
+        loss3 = self.nf3_loss(nf3_c, nf3_r, nf3_d)
+        loss4 = self.nf4_loss(nf4_r, nf4_c, nf4_d)
+        loss_dis = self.dis_loss(dis_c, dis_d)
         loss_top = self.top_loss(top)
-        loss_nf3_neg = self.nf3_neg_loss(nf3_neg)
+        loss_nf3_neg = self.nf3_neg_loss(neg_c, neg_r, neg_d)
         loss = loss1 + loss2 + loss3 + loss4 + loss_dis + loss_nf3_neg
         return loss
 
-    
+    def lookup(self, embeddings, ids):
+        """Embed a list of index vectors with a single lookup."""
+        sizes = tf.stack([tf.shape(x)[0] for x in ids])
+        embeds = embeddings(tf.concat(ids, axis=0))
+        return tf.split(embeds, sizes, axis=0)
+
+    def norm(self, x):
+        return tf.sqrt(tf.reduce_sum(tf.square(x), axis=-1, keepdims=True) + 1e-12)
+
     def reg(self, x):
-        res = tf.abs(tf.norm(x, axis=1) - self.reg_norm)
-        res = tf.reshape(res, [-1, 1])
-        return res
-        
-    def nf1_loss(self, input):
-        c = input[:, 0]
-        d = input[:, 1]
-        c = self.cls_embeddings(c)
-        d = self.cls_embeddings(d)
+        return tf.abs(self.norm(x) - self.reg_norm)
 
-        rc = tf.reshape(tf.math.abs(c[:, -1]), [-1, 1])
-        rd = tf.reshape(tf.math.abs(d[:, -1]), [-1, 1])
-        x1 = c[:, 0:-1]
-        x2 = d[:, 0:-1]
+    def decompose(self, x):
+        """Split class embeddings into center, radius and center regularization."""
+        center, radius = tf.split(x, [self.embedding_size, 1], axis=1)
+        return center, tf.math.abs(radius), self.reg(center)
+        
+    def inclusion_loss(self, x1, rc, x2, rd):
+        """Penalty for the ball (x1, rc) not lying inside (x2, rd)."""
+        euc = self.norm(x1 - x2)
+        return tf.nn.relu(euc + rc - rd - self.margin)
+
+    def nf1_loss(self, c, d):
+        # C subClassOf D
+        x1, rc, reg1 = self.decompose(c)
+        x2, rd, reg2 = self.decompose(d)
         # x1 = x1 / tf.reshape(tf.norm(x1, axis=1), [-1, 1])
         # x2 = x2 / tf.reshape(tf.norm(x2, axis=1), [-1, 1])
-        euc = tf.reshape(tf.norm(x1 - x2, axis=1), [-1, 1])
-        dst = tf.nn.relu(euc + rc - rd - self.margin)
-        return dst + self.reg(x1) + self.reg(x2)
+        return self.inclusion_loss(x1, rc, x2, rd) + reg1 + reg2
     
-    def nf2_loss(self, input):
-        c = input[:, 0]
-        d = input[:, 1]
-        e = input[:, 2]
-        c = self.cls_embeddings(c)
-        d = self.cls_embeddings(d)
-        e = self.cls_embeddings(e)
-        rc = tf.reshape(tf.math.abs(c[:, -1]), [-1, 1])
-        rd = tf.reshape(tf.math.abs(d[:, -1]), [-1, 1])
-        re = tf.reshape(tf.math.abs(e[:, -1]), [-1, 1])
+    def nf2_loss(self, c, d, e):
+        # C and D subClassOf E
+        x1, rc, reg1 = self.decompose(c)
+        x2, rd, reg2 = self.decompose(d)
+        x3, re, reg3 = self.decompose(e)
         sr = rc + rd
-        x1 = c[:, 0:-1]
-        x2 = d[:, 0:-1]
-        x3 = e[:, 0:-1]
         # x1 = x1 / tf.reshape(tf.norm(x1, axis=1), [-1, 1])
         # x2 = x2 / tf.reshape(tf.norm(x2, axis=1), [-1, 1])
         # x3 = x3 / tf.reshape(tf.norm(x3, axis=1), [-1, 1])
         
-        x = x2 - x1
-        dst = tf.reshape(tf.norm(x, axis=1), [-1, 1])
-        dst2 = tf.reshape(tf.norm(x3 - x1, axis=1), [-1, 1])
-        dst3 = tf.reshape(tf.norm(x3 - x2, axis=1), [-1, 1])
+        # All three pairwise center distances in one reduction
+        dst, dst2, dst3 = tf.unstack(
+            self.norm(tf.stack([x2 - x1, x3 - x1, x3 - x2])))
         # rdst = tf.nn.relu(tf.math.minimum(rc, rd) - re)
         dst_loss = (tf.nn.relu(dst - sr - self.margin)
                     + tf.nn.relu(dst2 - rc - self.margin)
                     + tf.nn.relu(dst3 - rd - self.margin))
                     # + rdst - self.margin)
-        return dst_loss + self.reg(x1) + self.reg(x2) + self.reg(x3)
+        return dst_loss + reg1 + reg2 + reg3
 
-    def nf3_loss(self, input):
+    def nf3_loss(self, c, r, d):
         # C subClassOf R some D
-        c = input[:, 0]
-        r = input[:, 1]
-        d = input[:, 2]
-        c = self.cls_embeddings(c)
-        d = self.cls_embeddings(d)
-        r = self.rel_embeddings(r)
-        x1 = c[:, 0:-1]
-        x2 = d[:, 0:-1]
+        x1, rc, reg1 = self.decompose(c)
+        x2, rd, reg2 = self.decompose(d)
         # x1 = x1 / tf.reshape(tf.norm(x1, axis=1), [-1, 1])
         # x2 = x2 / tf.reshape(tf.norm(x2, axis=1), [-1, 1])
         
         x3 = x1 + r
 
-        rc = tf.reshape(tf.math.abs(c[:, -1]), [-1, 1])
-        rd = tf.reshape(tf.math.abs(d[:, -1]), [-1, 1])
-        euc = tf.reshape(tf.norm(x3 - x2, axis=1), [-1, 1])
-        dst = tf.nn.relu(euc + rc - rd - self.margin)
-        
-        return dst + self.reg(x1) + self.reg(x2)
+        return self.inclusion_loss(x3, rc, x2, rd) + reg1 + reg2
 
-    def nf3_neg_loss(self, input):
+    def nf3_neg_loss(self, c, r, d):
         # C subClassOf R some D
-        c = input[:, 0]
-        r = input[:, 1]
-        d = input[:, 2]
-        c = self.cls_embeddings(c)
-        d = self.cls_embeddings(d)
-        r = self.rel_embeddings(r)
-        x1 = c[:, 0:-1]
-        x2 = d[:, 0:-1]
+        x1, rc, reg1 = self.decompose(c)
+        x2, rd, reg2 = self.decompose(d)
         # x1 = x1 / tf.norm(x1, axis=1)
         # x2 = x2 / tf.norm(x2, axis=1)
 
         x3 = x1 + r
 
-        rc = tf.reshape(tf.math.abs(c[:, -1]), [-1, 1])
-        rd = tf.reshape(tf.math.abs(d[:, -1]), [-1, 1])
-        euc = tf.reshape(tf.norm(x3 - x2, axis=1), [-1, 1])
+        euc = self.norm(x3 - x2)
         dst = -(euc - rc - rd - self.margin)
         
-        return tf.nn.relu(dst) + self.reg(x1) + self.reg(x2)
+        return tf.nn.relu(dst) + reg1 + reg2
 
 
-    def nf4_loss(self, input):
+    def nf4_loss(self, r, c, d):
         # R some C subClassOf D
-        r = input[:, 0]
-        c = input[:, 1]
-        d = input[:, 2]
-        c = self.cls_embeddings(c)
-        d = self.cls_embeddings(d)
-        r = self.rel_embeddings(r)
-        rc = tf.reshape(tf.math.abs(c[:, -1]), [-1, 1])
-        rd = tf.reshape(tf.math.abs(d[:, -1]), [-1, 1])
+        x1, rc, reg1 = self.decompose(c)
+        x2, rd, reg2 = self.decompose(d)
         sr = rc + rd
-        x1 = c[:, 0:-1]
-        x2 = d[:, 0:-1]
         # x1 = x1 / tf.reshape(tf.norm(x1, axis=1), [-1, 1])
         # x2 = x2 / tf.reshape(tf.norm(x2, axis=1), [-1, 1])
         
         # c - r should intersect with d
         x3 = x1 - r
-        dst = tf.reshape(tf.norm(x3 - x2, axis=1), [-1, 1])
+        dst = self.norm(x3 - x2)
         dst_loss = tf.nn.relu(dst - sr - self.margin)
-        return dst_loss + self.reg(x1) + self.reg(x2)
+        return dst_loss + reg1 + reg2
     
 
-    def dis_loss(self, input):
-        c = input[:, 0]
-        d = input[:, 1]
-        c = self.cls_embeddings(c)
-        d = self.cls_embeddings(d)
-        rc = tf.reshape(tf.math.abs(c[:, -1]), [-1, 1])
-        rd = tf.reshape(tf.math.abs(d[:, -1]), [-1, 1])
+    def dis_loss(self, c, d):
+        # C and D subClassOf Nothing
+        x1, rc, reg1 = self.decompose(c)
+        x2, rd, reg2 = self.decompose(d)
         sr = rc + rd
-        x1 = c[:, 0:-1]
-        x2 = d[:, 0:-1]
         # x1 = x1 / tf.reshape(tf.norm(x1, axis=1), [-1, 1])
         # x2 = x2 / tf.reshape(tf.norm(x2, axis=1), [-1, 1])
         
-        dst = tf.reshape(tf.norm(x2 - x1, axis=1), [-1, 1])
-        return tf.nn.relu(sr - dst + self.margin) + self.reg(x1) + self.reg(x2)
+        dst = self.norm(x2 - x1)
+        return tf.nn.relu(sr - dst + self.margin) + reg1 + reg2
 
 
     def top_loss(self, input):
         d = input[:, 0]
         d = self.cls_embeddings(d)
-        rd = tf.reshape(tf.math.abs(d[:, -1]), [-1, 1])
+        _, rd, _ = self.decompose(d)
         return tf.math.abs(rd - self.inf)
 
 
@@ -362,6 +334,8 @@ class MyModelCheckpoint(ModelCheckpoint):
         self.monitor = kwargs.pop('monitor')
         self.cls_list = kwargs.pop('cls_list')
         self.rel_list = kwargs.pop('rel_list')
+        self.cls_names = np.array(self.cls_list)
+        self.rel_names = np.array(self.rel_list)
         self.valid_data = kwargs.pop('valid_data')
         self.proteins = kwargs.pop('proteins')
         self.prot_index = list(self.proteins.values())
@@ -377,25 +351,21 @@ class MyModelCheckpoint(ModelCheckpoint):
             self.model.stop_training = True
             return
         el_model = self.model.layers[-1]
-        cls_embeddings = el_model.cls_embeddings.get_weights()[0]
-        rel_embeddings = el_model.rel_embeddings.get_weights()[0]
+        cls_embeddings, rel_embeddings = K.batch_get_value(
+            [el_model.cls_embeddings.embeddings,
+             el_model.rel_embeddings.embeddings])
 
         prot_embeds = cls_embeddings[self.prot_index]
         prot_rs = prot_embeds[:, -1].reshape(-1, 1)
         prot_embeds = prot_embeds[:, :-1]
 
-        cls_file = self.out_classes_file + '_test.pkl'
-        rel_file = self.out_relations_file + '_test.pkl'
-        # cls_file = f'{cls_file}_{epoch + 1}.pkl'
-        # rel_file = f'{rel_file}_{epoch + 1}.pkl'
-
-        df = pd.DataFrame(
-            {'classes': self.cls_list, 'embeddings': list(cls_embeddings)})
-        df.to_pickle(cls_file)
+        cls_file = self.out_classes_file + '_test.npz'
+        rel_file = self.out_relations_file + '_test.npz'
+        # cls_file = f'{cls_file}_{epoch + 1}.npz'
+        # rel_file = f'{rel_file}_{epoch + 1}.npz'
 
-        df = pd.DataFrame(
-            {'relations': self.rel_list, 'embeddings': list(rel_embeddings)})
-        df.to_pickle(rel_file)
+        np.savez(cls_file, classes=self.cls_names, embeddings=cls_embeddings)
+        np.savez(rel_file, relations=self.rel_names, embeddings=rel_embeddings)
         prot_embeds = prot_embeds / np.linalg.norm(prot_embeds, axis=1).reshape(-1, 1)
         
         mean_rank = 0
@@ -449,119 +419,111 @@ class MyModelCheckpoint(ModelCheckpoint):
 
         
 
-class Generator(object):
-
-    def __init__(self, data, batch_size=128, steps=100):
-        self.data = data
-        self.batch_size = batch_size
-        self.steps = steps
-        self.start = 0
-
-    def __iter__(self):
-        return self
-    
-    def __next__(self):
-        return self.next()
-
-    def reset(self):
-        self.start = 0
-
-    def next(self):
-        if self.start < self.steps:
-            nf1_index = np.random.choice(
-                self.data['nf1'].shape[0], self.batch_size)
-            nf2_index = np.random.choice(
-                self.data['nf2'].shape[0], self.batch_size)
-            nf3_index = np.random.choice(
-                self.data['nf3'].shape[0], self.batch_size)
-            nf4_index = np.random.choice(
-                self.data['nf4'].shape[0], self.batch_size)
-            dis_index = np.random.choice(
-                self.data['disjoint'].shape[0], self.batch_size)
-            top_index = np.random.choice(
-                self.data['top'].shape[0], self.batch_size)
-            nf3_neg_index = np.random.choice(
-                self.data['nf3_neg'].shape[0], self.batch_size)
-            nf1 = self.data['nf1'][nf1_index]
-            nf2 = self.data['nf2'][nf2_index]
-            nf3 = self.data['nf3'][nf3_index]
-            nf4 = self.data['nf4'][nf4_index]
-            dis = self.data['disjoint'][dis_index]
-            top = self.data['top'][top_index]
-            nf3_neg = self.data['nf3_neg'][nf3_neg_index]
-            labels = np.zeros((self.batch_size, 1), dtype=np.float32)
-            self.start += 1
-            return ([nf1, nf2, nf3, nf4, dis, top, nf3_neg], labels)
-        else:
-            self.reset()
-
+def make_dataset(data, batch_size=128, seed=100):
+    """Infinite dataset of random batches sampled in the graph.
+
+    Every normal form gets its own fixed sampling seed, so the batch
+    sequence is the same on every run.
+    """
+    keys = ['nf1', 'nf2', 'nf3', 'nf4', 'disjoint', 'top', 'nf3_neg']
+
+    def sample(_):
+        batch = []
+        for i, key in enumerate(keys):
+            table = tf.constant(data[key], dtype=tf.int32)
+            index = tf.random.uniform(
+                [batch_size], maxval=len(data[key]), dtype=tf.int32,
+                seed=seed + i)
+            batch.append(tf.gather(table, index))
+        labels = tf.zeros((batch_size, 1), dtype=tf.float32)
+        return tuple(batch), labels
+
+    dataset = tf.data.Dataset.range(1).repeat().map(sample)
+    return dataset.prefetch(tf.data.experimental.AUTOTUNE)
+
+
+# Normal forms written by Normalizer.groovy. The last group of every
+# alternative is named after its normal form.
+AXIOM_PATTERN = re.compile(
+    r'SubClassOf\((?:'
+    r'ObjectIntersectionOf\((\S+) (\S+)\) (?P<nf2>\S+)'
+    r'|ObjectSomeValuesFrom\((\S+) (\S+)\) (?P<nf4>\S+)'
+    r'|(\S+) ObjectSomeValuesFrom\((\S+) (?P<nf3>\S+)\)'
+    r'|(\S+) (?P<nf1>\S+)'
+    r')\)\s*$')
+NF_SIZES = {'nf1': 2, 'nf2': 3, 'nf3': 3, 'nf4': 3, 'disjoint': 3}
+
+
+# Bump whenever load_axioms changes what it parses or stores
+AXIOM_CACHE_VERSION = 2
+
+
+def load_axioms(filename):
+    """Parse the normal forms, reusing a cache saved next to the file."""
+    cache_file = f'{filename}.cache.npz'
+    # The cache belongs to exactly this version of the source file. Unzipped
+    # or copied files can be older than the cache, so "newer" is not enough.
+    source = os.stat(filename)
+    if os.path.exists(cache_file):
+        try:
+            cache = np.load(cache_file, allow_pickle=False)
+            if not isinstance(cache, np.lib.npyio.NpzFile):
+                raise ValueError('not an npz archive')
+            with cache:
+                if ('version' in cache.files
+                        and cache['version'] == AXIOM_CACHE_VERSION
+                        and cache['source_mtime_ns'] == source.st_mtime_ns
+                        and cache['source_size'] == source.st_size):
+                    classes = {
+                        k: v for v, k in enumerate(cache['classes'].tolist())}
+                    relations = {
+                        k: v for v, k in enumerate(cache['relations'].tolist())}
+                    data = {key: cache[key] for key in NF_SIZES}
+                    return classes, relations, data
+        except (OSError, EOFError, ValueError, KeyError,
+                zipfile.BadZipFile) as e:
+            logging.warning('Ignoring unreadable cache %s: %s', cache_file, e)
 
-def load_data(filename):
     classes = {}
     relations = {}
-    data = {'nf1': [], 'nf2': [], 'nf3': [], 'nf4': [], 'disjoint': []}
+    data = {key: array('i') for key in NF_SIZES}
     with open(filename) as f:
         for line in f:
-            # Ignore SubObjectPropertyOf
-            if line.startswith('SubObjectPropertyOf'):
-                continue
-            # Ignore SubClassOf()
-            line = line.strip()[11:-1]
-            if not line:
+            match = AXIOM_PATTERN.match(line)
+            # Ignore SubObjectPropertyOf and SubClassOf()
+            if match is None:
                 continue
-            if line.startswith('ObjectIntersectionOf('):
+            form = match.lastgroup
+            it = [x for x in match.groups() if x is not None]
+            if form == 'nf2':
                 # C and D SubClassOf E
-                it = line.split(' ')
-                c = it[0][21:]
-                d = it[1][:-1]
-                e = it[2]
-                if c not in classes:
-                    classes[c] = len(classes)
-                if d not in classes:
-                    classes[d] = len(classes)
-                if e not in classes:
-                    classes[e] = len(classes)
-                form = 'nf2'
+                c, d, e = it
                 if e == 'owl:Nothing':
                     form = 'disjoint'
-                data[form].append((classes[c], classes[d], classes[e]))
-                
-            elif line.startswith('ObjectSomeValuesFrom('):
+                data[form].extend((
+                    classes.setdefault(c, len(classes)),
+                    classes.setdefault(d, len(classes)),
+                    classes.setdefault(e, len(classes))))
+            elif form == 'nf4':
                 # R some C SubClassOf D
-                it = line.split(' ')
-                r = it[0][21:]
-                c = it[1][:-1]
-                d = it[2]
-                if c not in classes:
-                    classes[c] = len(classes)
-                if d not in classes:
-                    classes[d] = len(classes)
-                if r not in relations:
-                    relations[r] = len(relations)
-                data['nf4'].append((relations[r], classes[c], classes[d]))
-            elif line.find('ObjectSomeValuesFrom') != -1:
+                r, c, d = it
+                c = classes.setdefault(c, len(classes))
+                d = classes.setdefault(d, len(classes))
+                r = relations.setdefault(r, len(relations))
+                data['nf4'].extend((r, c, d))
+            elif form == 'nf3':
                 # C SubClassOf R some D
-                it = line.split(' ')
-                c = it[0]
-                r = it[1][21:]
-                d = it[2][:-1]
-                if c not in classes:
-                    classes[c] = len(classes)
-                if d not in classes:
-                    classes[d] = len(classes)
-                if r not in relations:
-                    relations[r] = len(relations)
-                data['nf3'].append((classes[c], relations[r], classes[d]))
+                c, r, d = it
+                c = classes.setdefault(c, len(classes))
+                d = classes.setdefault(d, len(classes))
+                r = relations.setdefault(r, len(relations))
+                data['nf3'].extend((c, r, d))
             else:
                 # C SubClassOf D
-                it = line.split(' ')
-                c = it[0]
-                d = it[1]
-                if c not in classes:
-                    classes[c] = len(classes)
-                if d not in classes:
-                    classes[d] = len(classes)
-                data['nf1'].append((classes[c], classes[d]))
+                c, d = it
+                data['nf1'].extend((
+                    classes.setdefault(c, len(classes)),
+                    classes.setdefault(d, len(classes))))
                 
     # Check if TOP in classes and insert if it is not there
     if 'owl:Thing' not in classes:
@@ -569,6 +531,40 @@ def load_data(filename):
     if 'owl:Nothing' not in classes:
         classes['owl:Nothing'] = len(classes)
 
+    for key, size in NF_SIZES.items():
+        data[key] = np.frombuffer(data[key], dtype=np.int32).reshape(-1, size)
+    save_axioms_cache(cache_file, source, classes, relations, data)
+    return classes, relations, data
+
+
+def save_axioms_cache(cache_file, source, classes, relations, data):
+    """Write the load_axioms cache atomically, skipping it on failure."""
+    # Concurrent jobs parsing the same file must never see a partial cache,
+    # so write to a temporary file and move it into place.
+    tmp_file = None
+    try:
+        fd, tmp_file = tempfile.mkstemp(
+            suffix='.npz', dir=os.path.dirname(cache_file) or '.')
+        with os.fdopen(fd, 'wb') as f:
+            np.savez_compressed(
+                f,
+                version=AXIOM_CACHE_VERSION,
+                source_mtime_ns=source.st_mtime_ns,
+                source_size=source.st_size,
+                classes=sorted(classes, key=classes.get),
+                relations=sorted(relations, key=relations.get),
+                **data)
+        os.chmod(tmp_file, 0o644)
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        logging.warning('Not caching parsed axioms in %s: %s', cache_file, e)
+        if tmp_file is not None and os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+
+def load_data(filename):
+    classes, relations, data = load_axioms(filename)
+
     prot_ids = []
     for k, v in classes.items():
         if not k.startswith('<http://purl.obolibrary.org/obo/GO_'):
@@ -582,8 +578,9 @@ def load_data(filename):
         for i in range(10):
             it = np.random.choice(n_prots, 2)
             if it[0] != it[1]:
-                data['disjoint'].append(
-                    (prot_ids[it[0]], prot_ids[it[1]], nothing))
+                data['disjoint'] = np.array(
+                    [(prot_ids[it[0]], prot_ids[it[1]], nothing)],
+                    dtype=np.int32)
                 break
         
     # Add corrupted triples for nf3
@@ -599,13 +596,8 @@ def load_data(filename):
         data['nf3_neg'].append((c, r, np.random.choice(prot_ids)))
         data['nf3_neg'].append((np.random.choice(prot_ids), r, d))
 
-    data['nf1'] = np.array(data['nf1'])
-    data['nf2'] = np.array(data['nf2'])
-    data['nf3'] = np.array(data['nf3'])
-    data['nf4'] = np.array(data['nf4'])
-    data['disjoint'] = np.array(data['disjoint'])
-    data['top'] = np.array([classes['owl:Thing'],])
-    data['nf3_neg'] = np.array(data['nf3_neg'])
+    data['top'] = np.array([[classes['owl:Thing']],], dtype=np.int32)
+    data['nf3_neg'] = np.array(data['nf3_neg'], dtype=np.int32)
                             
     for key, val in data.items():
         index = np.arange(len(data[key]))
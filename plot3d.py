@@ -2,7 +2,6 @@
 
 import click as ck
 import numpy as np
-import pandas as pd
 import logging
 import math
 import os
@@ -24,25 +23,25 @@ logging.basicConfig(level=logging.INFO)
     '--go-file', '-gf', default='data/go.obo',
     help='Gene Ontology file in OBO Format')
 @ck.option(
-    '--cls-embeds-file', '-cef', default='data/cls_embeddings.pkl_test.pkl',
+    '--cls-embeds-file', '-cef', default='data/cls_embeddings.pkl_test.npz',
     help='Class embedings file')
 @ck.option(
-    '--rel-embeds-file', '-ref', default='data/rel_embeddings.pkl_test.pkl',
+    '--rel-embeds-file', '-ref', default='data/rel_embeddings.pkl_test.npz',
     help='Relation embedings file')
 @ck.option(
     '--epoch', '-e', default='',
     help='Epoch embeddings')
 def main(go_file, cls_embeds_file, rel_embeds_file, epoch):
 
-    cls_df = pd.read_pickle(cls_embeds_file)
-    rel_df = pd.read_pickle(rel_embeds_file)
-    nb_classes = len(cls_df)
+    cls_npz = dict(np.load(cls_embeds_file))
+    rel_npz = dict(np.load(rel_embeds_file))
+    nb_classes = len(cls_npz['classes'])
     print(nb_classes)
-    nb_relations = len(rel_df)
-    embeds_list = cls_df['embeddings'].values
-    classes = {k: v for k, v in enumerate(cls_df['classes'])}
-    rembeds_list = rel_df['embeddings'].values
-    relations = {k: v for k, v in enumerate(rel_df['relations'])}
+    nb_relations = len(rel_npz['relations'])
+    embeds_list = cls_npz['embeddings']
+    classes = {k: v for k, v in enumerate(cls_npz['classes'])}
+    rembeds_list = rel_npz['embeddings']
+    relations = {k: v for k, v in enumerate(rel_npz['relations'])}
     size = len(embeds_list[0])
     embeds = np.zeros((nb_classes, size), dtype=np.float32)
     for i, emb in enumerate(embeds_list):